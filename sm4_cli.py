@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sm4_cli.py
+
+Консольний інтерфейс SM4 без графічної оболонки.
+
+Пакетна обробка дерев каталогів (формат файлів той самий, що й у GUI: ECB + PKCS#7,
+до імені зашифрованого файлу додається ".txt"):
+
+    python sm4_cli.py encrypt-tree ВХІД ВИХІД -k key.hex [--workers N] [--force]
+    python sm4_cli.py decrypt-tree ВХІД ВИХІД -k key.hex
+
+Результат записується у дзеркальне дерево ВИХІД. Великі файли діляться на порції,
+що обробляються паралельно, дрібні — пакуються в спільні завдання для пулу процесів.
+Файли, вихід яких новіший за вхід, пропускаються (якщо не задано --force).
+
+Потоковий режим для конвеєрів оболонки (stdin -> stdout, без тимчасових файлів,
+пам'ять обмежена розміром буфера):
+
+    tar c dir | python sm4_cli.py enc -k key.hex | ssh host 'cat > dir.tar.sm4'
+    python sm4_cli.py dec -k key.hex < dir.tar.sm4 | tar x
+"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import os
+import sys
+import time
+
+import sm4_core
+from sm4_core import load_key_hex
+
+ENCRYPTED_SUFFIX = ".txt"
+PART_SUFFIX = ".sm4part"
+
+LARGE_FILE_SIZE = 16 << 20   # файли від цього розміру діляться на порції
+RANGE_CHUNK_SIZE = 8 << 20   # розмір порції великого файлу (кратний 16)
+PACK_BYTES = 4 << 20         # дрібні файли пакуються в завдання до цього обсягу...
+PACK_FILES = 256             # ...або до цієї кількості файлів
+
+# класи розмірів для звіту: верхня межа (не включно) та підпис
+SIZE_CLASSES: Tuple[Tuple[float, str], ...] = (
+    (4 << 10, "< 4 КіБ"),
+    (64 << 10, "4–64 КіБ"),
+    (1 << 20, "64 КіБ–1 МіБ"),
+    (16 << 20, "1–16 МіБ"),
+    (float("inf"), "≥ 16 МіБ"),
+)
+
+# ---------- завдання для процесів пулу ----------
+
+_worker_key: Optional[bytes] = None
+_worker_backend: Optional[str] = None
+
+
+def _init_worker(key: bytes, backend: Optional[str]) -> None:
+    global _worker_key, _worker_backend
+    _worker_key, _worker_backend = key, backend
+
+
+def _pack_task(pairs: List[Tuple[str, str]], decrypt: bool) -> List[Tuple[str, int, float, Optional[str]]]:
+    """Обробка пакета дрібних файлів; для кожного — (вхід, розмір, секунди, помилка)."""
+    crypt = sm4_core.sm4_decrypt_ecb if decrypt else sm4_core.sm4_encrypt_ecb
+    results = []
+    for src, dst in pairs:
+        start = time.perf_counter()
+        size = 0
+        part = dst + PART_SUFFIX
+        try:
+            with open(src, "rb") as f:
+                data = f.read()
+            size = len(data)
+            out = crypt(data, _worker_key, backend=_worker_backend)  # type: ignore[arg-type]
+            with open(part, "wb") as f:
+                f.write(out)
+            os.replace(part, dst)
+            error = None
+        except (OSError, ValueError) as e:
+            if os.path.exists(part):
+                os.unlink(part)
+            error = str(e)
+        results.append((src, size, time.perf_counter() - start, error))
+    return results
+
+
+def _range_task(src: str, part: str, start: int, end: int, last: bool,
+                decrypt: bool) -> Tuple[str, int, float, int]:
+    """
+    Обробка порції [start, end) великого файлу. Блоки ECB незалежні, тож порція
+    записується у вихідний файл за тим самим зміщенням; остання порція доповнюється
+    (або з неї знімається доповнення). Повертає (вхід, байтів, секунди, довжина результату).
+    """
+    t = time.perf_counter()
+    with open(src, "rb") as f:
+        data = os.pread(f.fileno(), end - start, start)
+    if last:
+        crypt = sm4_core.sm4_decrypt_ecb if decrypt else sm4_core.sm4_encrypt_ecb
+        out = crypt(data, _worker_key, backend=_worker_backend)  # type: ignore[arg-type]
+    else:
+        cipher = sm4_core.new_cipher(_worker_key, len(data), backend=_worker_backend)  # type: ignore[arg-type]
+        out = cipher.decrypt_blocks(data) if decrypt else cipher.encrypt_blocks(data)
+    fd = os.open(part, os.O_WRONLY)
+    try:
+        os.pwrite(fd, out, start)
+    finally:
+        os.close(fd)
+    return src, end - start, time.perf_counter() - t, len(out)
+
+
+# ---------- планування ----------
+
+def _output_path(rel: Path, dst_root: Path, decrypt: bool) -> Path:
+    if not decrypt:
+        return dst_root / rel.with_name(rel.name + ENCRYPTED_SUFFIX)
+    if rel.name.endswith(ENCRYPTED_SUFFIX) and len(rel.name) > len(ENCRYPTED_SUFFIX):
+        return dst_root / rel.with_name(rel.name[:-len(ENCRYPTED_SUFFIX)])
+    return dst_root / rel
+
+
+def _walk(src_root: Path, dst_root: Path) -> Iterator[Path]:
+    skip = dst_root.resolve()
+    for dirpath, dirnames, filenames in os.walk(src_root):
+        # вихідне дерево всередині вхідного не обходиться
+        dirnames[:] = sorted(d for d in dirnames if (Path(dirpath) / d).resolve() != skip)
+        for name in sorted(filenames):
+            if not name.endswith(PART_SUFFIX):
+                yield Path(dirpath) / name
+
+
+def _is_up_to_date(src: Path, dst: Path) -> bool:
+    try:
+        return dst.stat().st_mtime >= src.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+class TreeReport:
+    """Накопичення статистики: загальні MB/s і файли/с та розподіл за класами розмірів."""
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.errors: List[Tuple[str, str]] = []
+        self.elapsed = 0.0
+        self.classes: Dict[str, List[float]] = {label: [0, 0, 0.0] for _, label in SIZE_CLASSES}
+
+    def add(self, size: int, seconds: float) -> None:
+        self.files += 1
+        self.bytes += size
+        for bound, label in SIZE_CLASSES:
+            if size < bound:
+                entry = self.classes[label]
+                entry[0] += 1
+                entry[1] += size
+                entry[2] += seconds
+                return
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "files": self.files,
+            "skipped": self.skipped,
+            "errors": len(self.errors),
+            "bytes": self.bytes,
+            "elapsed": self.elapsed,
+            "mb_per_s": self.bytes / (1 << 20) / self.elapsed if self.elapsed else 0.0,
+            "files_per_s": self.files / self.elapsed if self.elapsed else 0.0,
+            "by_size": {
+                label: {"files": int(n), "bytes": int(b), "worker_seconds": s}
+                for label, (n, b, s) in self.classes.items()
+            },
+        }
+
+    def print(self, out=sys.stdout) -> None:
+        d = self.as_dict()
+        print(
+            f"Файлів: оброблено {d['files']}, пропущено (актуальні) {d['skipped']}, "
+            f"помилок {d['errors']}", file=out,
+        )
+        print(
+            f"Обсяг: {d['bytes'] / (1 << 20):.1f} МіБ за {d['elapsed']:.2f} с — "
+            f"{d['mb_per_s']:.2f} МіБ/с, {d['files_per_s']:.1f} файлів/с", file=out,
+        )
+        print("Розподіл за розміром (МіБ/с — на один процес):", file=out)
+        for label, (n, b, s) in self.classes.items():
+            if n:
+                rate = b / (1 << 20) / s if s else 0.0
+                print(f"  {label:<14} {int(n):>8} файлів  {b / (1 << 20):>10.1f} МіБ  {rate:>8.2f} МіБ/с", file=out)
+        for path, message in self.errors:
+            first_line = message.splitlines()[0] if message else ""
+            print(f"  ПОМИЛКА {path}: {first_line}", file=out)
+
+
+def process_tree(src_root, dst_root, key: bytes, decrypt: bool = False, workers: Optional[int] = None,
+                 force: bool = False, backend: Optional[str] = None,
+                 large_file_size: int = LARGE_FILE_SIZE, chunk_size: int = RANGE_CHUNK_SIZE,
+                 pack_bytes: int = PACK_BYTES, pack_files: int = PACK_FILES) -> "TreeReport":
+    """
+    Шифрування (або розшифрування) всіх файлів дерева src_root у дзеркальне дерево dst_root
+    пулом із workers процесів. Помилки окремих файлів не зупиняють обробку — вони
+    збираються у звіті. Повертає TreeReport (as_dict() — статистика, print() — звіт).
+    """
+    src_root, dst_root = Path(src_root), Path(dst_root)
+    if not src_root.is_dir():
+        raise ValueError(f"Вхідний каталог не знайдено: {src_root}")
+    chunk_size = max(16, chunk_size - chunk_size % 16)
+    workers = workers or os.cpu_count() or 1
+    report = TreeReport()
+    start = time.perf_counter()
+
+    packs: List[List[Tuple[str, str]]] = []
+    pack: List[Tuple[str, str]] = []
+    pack_size = 0
+    # великі файли: шлях -> [частковий файл, вихід, розмір, незавершені порції, розмір результату]
+    large: Dict[str, list] = {}
+    ranges: List[Tuple[str, str, int, int, bool, bool]] = []
+
+    for src in _walk(src_root, dst_root):
+        dst = _output_path(src.relative_to(src_root), dst_root, decrypt)
+        if not force and _is_up_to_date(src, dst):
+            report.skipped += 1
+            continue
+        try:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            size = src.stat().st_size
+        except OSError as e:  # висячий симлінк, файл видалено під час обходу тощо
+            report.errors.append((str(src), str(e)))
+            continue
+        if size < large_file_size or size == 0:  # порожній файл не має порцій — лише пакетом
+            pack.append((str(src), str(dst)))
+            pack_size += size
+            if pack_size >= pack_bytes or len(pack) >= pack_files:
+                packs.append(pack)
+                pack, pack_size = [], 0
+            continue
+        try:
+            if decrypt:
+                sm4_core.check_key(src, key, backend)  # неправильний ключ — без обробки файлу
+        except ValueError as e:
+            report.errors.append((str(src), str(e)))
+            continue
+        part = str(dst) + PART_SUFFIX
+        with open(part, "wb") as f:
+            f.truncate(size if decrypt else sm4_core.pkcs7_padded_length(size, 16))
+        positions = list(range(0, size, chunk_size))
+        large[str(src)] = [part, str(dst), size, len(positions), 0]
+        for pos in positions:
+            end = min(pos + chunk_size, size)
+            ranges.append((str(src), part, pos, end, end == size, decrypt))
+    if pack:
+        packs.append(pack)
+
+    def finish_large(src: str, out_len: int, pos_of_last: Optional[int]) -> None:
+        entry = large[src]
+        if pos_of_last is not None:
+            entry[4] = pos_of_last + out_len
+        entry[3] -= 1
+        if entry[3] == 0:
+            if decrypt:
+                os.truncate(entry[0], entry[4])
+            os.replace(entry[0], entry[1])
+
+    def fail_large(src: str, message: str) -> None:
+        entry = large.pop(src, None)
+        if entry is not None:
+            report.errors.append((src, message))
+            if os.path.exists(entry[0]):
+                os.unlink(entry[0])
+
+    large_seconds: Dict[str, float] = {}
+
+    def handle_range(task, result) -> None:
+        src, _, pos, _, last, _ = task
+        if src not in large:
+            return  # файл уже відкинуто через помилку в іншій порції
+        _, _, seconds, out_len = result
+        large_seconds[src] = large_seconds.get(src, 0.0) + seconds
+        entry = large[src]
+        finish_large(src, out_len, pos if last else None)
+        if entry[3] == 0:
+            report.add(entry[2], large_seconds.pop(src))
+
+    def handle_pack(results) -> None:
+        for src, size, seconds, error in results:
+            if error is None:
+                report.add(size, seconds)
+            else:
+                report.errors.append((src, error))
+
+    if workers <= 1:
+        _init_worker(key, backend)
+        for p in packs:
+            handle_pack(_pack_task(p, decrypt))
+        for task in ranges:
+            try:
+                handle_range(task, _range_task(*task))
+            except (OSError, ValueError) as e:
+                fail_large(task[0], str(e))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(key, backend)) as pool:
+            # порції великих файлів ставляться першими: вони найдовші
+            futures = {pool.submit(_range_task, *task): ("range", task) for task in ranges}
+            futures.update({pool.submit(_pack_task, p, decrypt): ("pack", p) for p in packs})
+            for fut in as_completed(futures):
+                kind, task = futures[fut]
+                if kind == "pack":
+                    handle_pack(fut.result())
+                    continue
+                try:
+                    handle_range(task, fut.result())
+                except (OSError, ValueError) as e:
+                    fail_large(task[0], str(e))
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+# ---------- командний рядок ----------
+
+def _cmd_tree(args: argparse.Namespace) -> int:
+    key = load_key_hex(args.key)
+    report = process_tree(
+        args.src, args.dst, key, decrypt=args.command == "decrypt-tree",
+        workers=args.workers, force=args.force, backend=args.backend,
+        large_file_size=args.large_mb << 20, chunk_size=args.chunk_mb << 20,
+    )
+    report.print()
+    return 1 if report.errors else 0
+
+
+def _cmd_pipe(args: argparse.Namespace) -> int:
+    key = load_key_hex(args.key)
+    stream = sm4_core.sm4_decrypt_stream if args.command == "dec" else sm4_core.sm4_encrypt_stream
+    stdout = sys.stdout.buffer
+    try:
+        stream(sys.stdin.buffer, stdout, key, chunk_size=args.buffer_kb << 10, backend=args.backend)
+        stdout.flush()
+    except BrokenPipeError:
+        # отримувач закрив канал (наприклад, head) — завершення без трасування
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+        return 1
+    return 0
+
+
+def _positive_int(text: str) -> int:
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"очікується додатне ціле число, отримано: {text!r}")
+    return value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="sm4", description="Шифрування SM4 з командного рядка.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("encrypt-tree", "зашифрувати всі файли каталогу в дзеркальне дерево"),
+        ("decrypt-tree", "розшифрувати всі файли каталогу в дзеркальне дерево"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("src", help="вхідний каталог")
+        p.add_argument("dst", help="вихідний каталог (дзеркальне дерево)")
+        p.add_argument("-k", "--key", required=True, help="файл ключа (HEX)")
+        p.add_argument("-j", "--workers", type=int, default=None, help="кількість процесів (типово — усі ядра)")
+        p.add_argument("--force", action="store_true", help="обробляти й актуальні файли")
+        p.add_argument("--backend", default=None, help="рушій SM4 (типово — автоматичний вибір)")
+        p.add_argument("--large-mb", type=_positive_int, default=LARGE_FILE_SIZE >> 20,
+                       help="файли від цього розміру (МіБ) діляться на порції")
+        p.add_argument("--chunk-mb", type=_positive_int, default=RANGE_CHUNK_SIZE >> 20, help="розмір порції, МіБ")
+        p.set_defaults(func=_cmd_tree)
+    for name, help_text in (
+        ("enc", "зашифрувати stdin у stdout (ECB + PKCS#7)"),
+        ("dec", "розшифрувати stdin у stdout"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("-k", "--key", required=True, help="файл ключа (HEX)")
+        p.add_argument("-b", "--buffer-kb", type=_positive_int, default=sm4_core.STREAM_CHUNK_SIZE >> 10,
+                       help="розмір буфера читання, КіБ")
+        p.add_argument("--backend", default=None, help="рушій SM4 (типово — автоматичний вибір)")
+        p.set_defaults(func=_cmd_pipe)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"Помилка: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
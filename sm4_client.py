@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sm4_client.py
+
+Легкий клієнт локального демона SM4 (sm4_daemon.py). Не імпортує sm4_core,
+тому короткі скрипти не платять за його завантаження й розгортання ключів:
+шифрування виконує демон з «теплими» ключами.
+
+Протокол (Unix-сокет, усі числа big-endian):
+    запит   : u32 довжина | u8 операція | 16 байтів ключа | дані
+    відповідь: u32 довжина | u8 статус (0 — успіх, 1 — помилка) | результат або текст помилки
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+
+OP_ENCRYPT = 1
+OP_DECRYPT = 2
+OP_STATS = 3
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# обмеження розміру кадру: захищає обидві сторони від нескінченного читання
+MAX_FRAME_SIZE = 64 << 20
+
+_FRAME_HEADER = struct.Struct(">IB")
+_PEERCRED = struct.Struct("3i")  # struct ucred: pid, uid, gid
+
+
+def _private_socket_dir() -> str:
+    """Каталог користувача для сокета, коли немає XDG_RUNTIME_DIR (демон створює його з правами 0700)."""
+    return os.path.join(tempfile.gettempdir(), f"sm4d-{os.getuid()}")
+
+
+def default_socket_path() -> str:
+    """
+    Шлях до сокета демона: $SM4_DAEMON_SOCKET, інакше $XDG_RUNTIME_DIR/sm4d.sock,
+    інакше сокет в окремому каталозі користувача (не прямо в спільному /tmp).
+    """
+    path = os.environ.get("SM4_DAEMON_SOCKET")
+    if path:
+        return path
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or _private_socket_dir(), "sm4d.sock")
+
+
+def _check_socket_owner(path: str) -> None:
+    """Ключі надсилаються лише сокету, створеному поточним користувачем."""
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(
+            f"Шлях {path} не є сокетом демона SM4 поточного користувача.\n"
+            "Ключі не надсилаються чужому процесу."
+        )
+
+
+def _check_peer(sock: socket.socket, path: str) -> None:
+    """Перевірка власника процесу на іншому кінці (Linux, SO_PEERCRED) — без гонки між lstat і connect."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    _, uid, _ = _PEERCRED.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+    if uid != os.getuid():
+        raise PermissionError(f"Сокет {path} обслуговує процес іншого користувача (uid {uid}).")
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        r = sock.recv_into(view[pos:])
+        if not r:
+            raise ConnectionError("Демон SM4 закрив з'єднання.")
+        pos += r
+    return bytes(buf)
+
+
+class SM4Client:
+    """
+    Синхронний клієнт демона SM4. Методи sm4_encrypt_ecb/sm4_decrypt_ecb
+    повторюють однойменні функції sm4_core і дають ідентичний результат.
+    З'єднання одне на об'єкт; виклики з різних потоків серіалізуються.
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = 30.0) -> None:
+        self.path = path or default_socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            _check_socket_owner(self.path)
+            self._sock.connect(self.path)
+            _check_peer(self._sock, self.path)
+        except OSError:
+            self._sock.close()
+            raise
+        self._lock = threading.Lock()
+
+    def _call(self, op: int, key: bytes, data: bytes) -> bytes:
+        if len(key) != 16:
+            raise ValueError("Ключ SM4 повинен містити рівно 16 байтів (128 біт).")
+        if 17 + len(data) > MAX_FRAME_SIZE:
+            raise ValueError(
+                f"Запит до демона SM4 завеликий (обмеження {MAX_FRAME_SIZE} байтів).\n"
+                "Для великих даних використовуйте sm4_core напряму."
+            )
+        with self._lock:
+            self._sock.sendall(_FRAME_HEADER.pack(17 + len(data), op) + key + data)
+            length, status = _FRAME_HEADER.unpack(_recv_exact(self._sock, _FRAME_HEADER.size))
+            body = _recv_exact(self._sock, length - 1)
+        if status != STATUS_OK:
+            raise ValueError(body.decode("utf-8", "replace"))
+        return body
+
+    def sm4_encrypt_ecb(self, data: bytes, key: bytes) -> bytes:
+        """Шифрування ECB + PKCS#7 у демоні (як sm4_core.sm4_encrypt_ecb)."""
+        return self._call(OP_ENCRYPT, key, bytes(data))
+
+    def sm4_decrypt_ecb(self, data: bytes, key: bytes) -> bytes:
+        """Розшифрування ECB зі зняттям PKCS#7 у демоні (як sm4_core.sm4_decrypt_ecb)."""
+        return self._call(OP_DECRYPT, key, bytes(data))
+
+    def stats(self) -> Dict[str, object]:
+        """Метрики демона: глибина черги, розміри пакетів, гістограма затримок."""
+        return json.loads(self._call(OP_STATS, bytes(16), b""))
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def __enter__(self) -> "SM4Client":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+_shared_client: Optional[SM4Client] = None
+_shared_lock = threading.Lock()
+
+
+def _client() -> SM4Client:
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = SM4Client()
+        return _shared_client
+
+
+def sm4_encrypt_ecb(data: bytes, key: bytes) -> bytes:
+    """Шифрування через спільне з'єднання з демоном за шляхом default_socket_path()."""
+    return _client().sm4_encrypt_ecb(data, key)
+
+
+def sm4_decrypt_ecb(data: bytes, key: bytes) -> bytes:
+    """Розшифрування через спільне з'єднання з демоном за шляхом default_socket_path()."""
+    return _client().sm4_decrypt_ecb(data, key)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sm4_daemon.py
+
+Локальний демон SM4: слухає Unix-сокет (протокол — див. sm4_client.py),
+тримає «теплі» розгорнуті ключі та об'єднує одночасні дрібні запити з однаковим
+ключем і операцією в один пакетний виклик рушія SM4.
+
+Запуск:  python sm4_daemon.py [--socket ШЛЯХ] [--backend НАЗВА] [--window МС]
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+from sm4_core import SM4, _ciphertext_length_error, new_cipher, pkcs7_pad, pkcs7_unpad_length
+from sm4_client import (
+    MAX_FRAME_SIZE,
+    OP_DECRYPT,
+    OP_ENCRYPT,
+    OP_STATS,
+    STATUS_ERROR,
+    STATUS_OK,
+    _FRAME_HEADER,
+    _private_socket_dir,
+    default_socket_path,
+)
+
+# межі кошиків гістограм: кількість запитів у пакеті та затримка відповіді (мс)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class _Histogram:
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return dict(zip(labels, self.counts))
+
+
+class SM4Daemon:
+    """
+    Демон SM4 на asyncio. Запити накопичуються протягом batch_window секунд
+    (або до max_batch_bytes) окремо для кожної пари (операція, ключ), після чого
+    весь пакет обробляється одним викликом encrypt_inplace/decrypt_inplace у
+    робочому потоці. Розгорнуті ключі зберігаються в LRU на max_keys записів.
+    """
+
+    def __init__(self, path: Optional[str] = None, backend: Optional[str] = None,
+                 batch_window: float = 0.001, max_batch_bytes: int = 1 << 20,
+                 max_keys: int = 256) -> None:
+        self.path = path or default_socket_path()
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch_bytes = max_batch_bytes
+        self.max_keys = max_keys
+        self.ready = threading.Event()
+        self._ciphers: "OrderedDict[bytes, SM4]" = OrderedDict()
+        self._pending: Dict[Tuple[int, bytes], List[Tuple[bytes, asyncio.Future]]] = {}
+        self._pending_bytes: Dict[Tuple[int, bytes], int] = {}
+        # один робочий потік: обчислення SM4 послідовні, цикл подій лишається вільним
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sm4d")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self._batch_sizes = _Histogram(BATCH_SIZE_BUCKETS)
+        self._latency = _Histogram(LATENCY_BUCKETS_MS)
+
+    # ---------- пакетна обробка ----------
+
+    def _cipher(self, key: bytes) -> SM4:
+        """Теплий шифр для ключа (викликається лише з робочого потоку)."""
+        cipher = self._ciphers.get(key)
+        if cipher is None:
+            cipher = self._ciphers[key] = new_cipher(key, self.max_batch_bytes, backend=self.backend)
+            if len(self._ciphers) > self.max_keys:
+                self._ciphers.popitem(last=False)
+        else:
+            self._ciphers.move_to_end(key)
+        return cipher
+
+    def _run_batch(self, op: int, key: bytes, items: List[bytes]) -> List[Tuple[bool, object]]:
+        cipher = self._cipher(key)
+        if op == OP_ENCRYPT:
+            parts = [pkcs7_pad(data, 16) for data in items]
+            buf = bytearray(b"".join(parts))
+            cipher.encrypt_inplace(buf)
+            results: List[Tuple[bool, object]] = []
+            pos = 0
+            for part in parts:
+                results.append((True, bytes(buf[pos:pos + len(part)])))
+                pos += len(part)
+            return results
+
+        valid = [bool(data) and len(data) % 16 == 0 for data in items]
+        buf = bytearray(b"".join(data for data, ok in zip(items, valid) if ok))
+        cipher.decrypt_inplace(buf)
+        results = []
+        pos = 0
+        for data, ok in zip(items, valid):
+            if not ok:
+                results.append((False, _ciphertext_length_error()))
+                continue
+            block = memoryview(buf)[pos:pos + len(data)]
+            pos += len(data)
+            try:
+                results.append((True, bytes(block[:pkcs7_unpad_length(block, 16)])))
+            except ValueError as e:
+                results.append((False, e))
+            finally:
+                block.release()
+        return results
+
+    async def _flush(self, batch_key: Tuple[int, bytes]) -> None:
+        items = self._pending.pop(batch_key, None)
+        self._pending_bytes.pop(batch_key, None)
+        if not items:
+            return
+        self.batches += 1
+        self._batch_sizes.add(len(items))
+        op, key = batch_key
+        try:
+            results = await self._loop.run_in_executor(  # type: ignore[union-attr]
+                self._executor, self._run_batch, op, key, [data for data, _ in items],
+            )
+        except Exception as e:  # непередбачена помилка рушія — усім запитам пакета
+            results = [(False, e)] * len(items)
+        for (_, fut), (ok, value) in zip(items, results):
+            if fut.done():
+                continue
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)  # type: ignore[arg-type]
+
+    async def submit(self, op: int, key: bytes, data: bytes) -> bytes:
+        """Постановка запиту в пакет для (op, key); повертає результат після обробки пакета."""
+        batch_key = (op, key)
+        fut = self._loop.create_future()  # type: ignore[union-attr]
+        items = self._pending.setdefault(batch_key, [])
+        items.append((data, fut))
+        size = self._pending_bytes[batch_key] = self._pending_bytes.get(batch_key, 0) + len(data)
+        if size >= self.max_batch_bytes:
+            asyncio.ensure_future(self._flush(batch_key))
+        elif len(items) == 1:
+            self._loop.call_later(  # type: ignore[union-attr]
+                self.batch_window, lambda: asyncio.ensure_future(self._flush(batch_key)),
+            )
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            return await fut
+        finally:
+            self.queue_depth -= 1
+
+    # ---------- мережева частина ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    length, op = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if length < 17 or length > MAX_FRAME_SIZE:
+                    self.errors += 1
+                    await self._reply(writer, STATUS_ERROR, "Некоректна довжина кадру запиту.".encode("utf-8"))
+                    break
+                key = await reader.readexactly(16)
+                data = await reader.readexactly(length - 17)
+                start = time.perf_counter()
+                status, body = STATUS_OK, b""
+                if op == OP_STATS:
+                    body = json.dumps(self.stats(), ensure_ascii=False).encode("utf-8")
+                elif op in (OP_ENCRYPT, OP_DECRYPT):
+                    self.requests += 1
+                    try:
+                        body = await self.submit(op, key, data)
+                    except ValueError as e:
+                        self.errors += 1
+                        status, body = STATUS_ERROR, str(e).encode("utf-8")
+                    self._latency.add((time.perf_counter() - start) * 1000)
+                else:
+                    self.errors += 1
+                    status, body = STATUS_ERROR, f"Невідома операція: {op}.".encode("utf-8")
+                await self._reply(writer, status, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _reply(writer: asyncio.StreamWriter, status: int, body: bytes) -> None:
+        writer.write(_FRAME_HEADER.pack(1 + len(body), status) + body)
+        await writer.drain()
+
+    def _is_socket(self) -> bool:
+        """Чи існує за self.path саме сокет; будь-який інший файл — помилка, а не «залишок»."""
+        try:
+            st = os.lstat(self.path)
+        except FileNotFoundError:
+            return False
+        if not stat.S_ISSOCK(st.st_mode):
+            raise RuntimeError(f"Шлях {self.path} зайнятий файлом, який не є сокетом; демон його не видалятиме.")
+        if st.st_uid != os.getuid():
+            raise RuntimeError(f"Сокет {self.path} належить іншому користувачу (uid {st.st_uid}).")
+        return True
+
+    def _prepare_socket_dir(self) -> None:
+        """Типовий каталог сокета в /tmp створюється з правами 0700 і має належати користувачу."""
+        parent = os.path.dirname(os.path.abspath(self.path))
+        if parent != os.path.abspath(_private_socket_dir()):
+            return
+        try:
+            os.mkdir(parent, 0o700)
+        except FileExistsError:
+            pass
+        st = os.lstat(parent)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise RuntimeError(
+                f"Каталог {parent} не є приватним каталогом поточного користувача (потрібно 0700)."
+            )
+
+    def _remove_stale_socket(self) -> None:
+        if not self._is_socket():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)  # сокет лишився від завершеного процесу
+        else:
+            raise RuntimeError(f"Демон SM4 уже працює на сокеті {self.path}.")
+        finally:
+            probe.close()
+
+    async def serve_forever(self) -> None:
+        """Запуск сервера; завершується після stop()."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._prepare_socket_dir()
+        self._remove_stale_socket()
+        old_umask = os.umask(0o177)  # ключі передаються через сокет — доступ лише власнику
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        finally:
+            os.umask(old_umask)
+        self.ready.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            self._executor.shutdown(wait=True)
+            self._ciphers.clear()
+            try:
+                if self._is_socket():
+                    os.unlink(self.path)
+            except RuntimeError:
+                pass  # сокет замінили іншим файлом — не наш, лишаємо
+            self.ready.clear()
+
+    def stop(self) -> None:
+        """Зупинка демона (можна викликати з будь-якого потоку)."""
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "warm_keys": len(self._ciphers),
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_hist": self._batch_sizes.as_dict(),
+            "latency_ms_hist": self._latency.as_dict(),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Локальний демон шифрування SM4 (Unix-сокет).")
+    parser.add_argument("--socket", default=None, help="шлях до Unix-сокета (типово — default_socket_path())")
+    parser.add_argument("--backend", default=None, help="рушій SM4 (типово — автоматичний вибір)")
+    parser.add_argument("--window", type=float, default=1.0, help="вікно накопичення пакета, мс")
+    args = parser.parse_args(argv)
+    daemon = SM4Daemon(args.socket, backend=args.backend, batch_window=args.window / 1000)
+    print(f"Демон SM4 слухає {daemon.path}")
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,10 @@ from customtkinter import (
 from sm4_core import (
     sm4_encrypt_ecb,
     sm4_decrypt_ecb,
+    encrypt_file,
+    decrypt_file,
+    decrypt_container,
+    check_key,
     generate_key,
     load_key_hex,
 )
@@ -1004,10 +1008,9 @@ class SM4App(ctk.CTk):
             )
             return
         try:
-            data = self.enc_file.read_bytes()
-            ct = sm4_encrypt_ecb(data, self.enc_key)
             out = self.enc_file.with_suffix(self.enc_file.suffix + ".txt")
-            out.write_bytes(ct)
+            # файл обробляється через mmap: пам'ять не залежить від розміру файлу
+            encrypt_file(self.enc_file, out, self.enc_key)
             messagebox.showinfo(
                 "Шифрування файлу виконано",
                 f"Файл успішно зашифровано.\n\nРезультат збережено як:\n{out.name}",
@@ -1050,10 +1053,12 @@ class SM4App(ctk.CTk):
             key = self.enc_key
 
         try:
-            ct = Path(p).read_bytes()
-            pt = sm4_decrypt_ecb(ct, key)
             out = Path(p).with_suffix("")
-            out.write_bytes(pt)
+            # швидка перевірка ключа (KCV або останній блок) і визначення формату
+            if check_key(p, key) == "container":
+                decrypt_container(p, out, key)
+            else:
+                decrypt_file(p, out, key)
             messagebox.showinfo(
                 "Розшифрування файлу виконано",
                 f"Файл успішно розшифровано.\n\nРезультат збережено як:\n{out.name}",
@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import contextlib
+import errno
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 from pathlib import Path
+import sm4_cli
+import sm4_core
 from sm4_core import SM4, sm4_encrypt_ecb, sm4_decrypt_ecb, generate_key
+from sm4_client import SM4Client
+from sm4_daemon import SM4Daemon
 
 
 def hex_to_bytes(s: str) -> bytes:
@@ -142,9 +156,982 @@ def test_truncated_ciphertext():
     assert False, "Обрізаний шифртекст має викликати помилку"
 
 
+# ---------- 6. Табличний рушій ----------
+
+def test_table_engine_matches_reference():
+    """T-таблиці дають той самий результат, що й еталонний побайтовий раунд."""
+    for _ in range(50):
+        c = SM4(generate_key())
+        block = generate_key()
+        ct = c.encrypt_block(block)
+        assert ct == c._crypt_block_reference(block, c._rk_enc), "T-table: шифрування розійшлося з еталоном"
+        assert c.decrypt_block(ct) == block, "T-table: розшифрування не повертає вихідний блок"
+
+
+def test_compiled_mode():
+    """Скомпільований режим: KAT та збіг із табличним рушієм."""
+    key = hex_to_bytes("0123456789ABCDEFFEDCBA9876543210")
+    c = SM4(key, compiled=True)
+    ct = c.encrypt_block(key)
+    assert ct.hex().upper() == "681EDF34D206965E86B3E94F536E4246", "compiled: KAT не пройдено"
+    assert c.decrypt_block(ct) == key, "compiled: розшифрування не повертає вихідний блок"
+    assert c.compiled_block_function() is c.compiled_block_function(), "compiled: функція не кешується"
+
+    plain = SM4(key)
+    for _ in range(20):
+        block = generate_key()
+        assert c.encrypt_block(block) == plain.encrypt_block(block), "compiled: результат розійшовся"
+
+
+# ---------- 7. Пакетний API ----------
+
+def test_encrypt_blocks_buffers():
+    key = generate_key()
+    c = SM4(key)
+    data = bytes(range(256)) * 2
+    expected = b"".join(c.encrypt_block(data[i:i + 16]) for i in range(0, len(data), 16))
+
+    assert bytes(c.encrypt_blocks(data)) == expected, "encrypt_blocks(bytes) не співпало"
+    assert bytes(c.encrypt_blocks(memoryview(data))) == expected, "encrypt_blocks(memoryview) не співпало"
+    assert bytes(SM4(key, compiled=True).encrypt_blocks(data)) == expected, "compiled encrypt_blocks не співпало"
+
+    buf = bytearray(data)
+    assert c.encrypt_blocks(buf, buf) is buf and buf == expected, "шифрування на місці не спрацювало"
+    c.decrypt_blocks(buf, buf)
+    assert buf == data, "розшифрування на місці не повертає вихідні дані"
+
+    try:
+        c.encrypt_blocks(data[:-1])
+    except ValueError:
+        return
+    assert False, "Довжина, не кратна 16, має викликати помилку"
+
+
+def test_numpy_backend():
+    """NumPy-рушій дає ті самі блоки, що й чистий Python (пропускається без NumPy)."""
+    if not sm4_core.HAVE_NUMPY:
+        return
+    key = generate_key()
+    data = bytes(range(256)) * 40
+    c = sm4_core.SM4Numpy(key)
+    c.chunk_blocks = 7  # перевіряємо й обробку частинами
+    ct = c.encrypt_blocks(data)
+    assert ct == SM4(key).encrypt_blocks(data), "SM4Numpy: шифрування розійшлося з SM4"
+    assert bytes(c.decrypt_blocks(ct)) == data, "SM4Numpy: розшифрування не повертає вихідні дані"
+    assert bytes(c.encrypt_blocks(b"")) == b"", "SM4Numpy: порожній буфер"
+
+
+def test_zero_copy_ecb():
+    key = generate_key()
+    for data in (b"", b"abc", bytes(range(48)), bytes(range(100))):
+        expected = sm4_encrypt_ecb(data, key)
+
+        dst = bytearray(sm4_core.pkcs7_padded_length(len(data)))
+        assert sm4_core.sm4_encrypt_ecb_into(data, dst, key) == len(expected)
+        assert dst == expected, "sm4_encrypt_ecb_into не співпало з sm4_encrypt_ecb"
+
+        buf = bytearray(data)
+        assert sm4_core.sm4_encrypt_ecb_inplace(buf, key) == expected, "шифрування на місці не співпало"
+
+        pt = sm4_core.sm4_decrypt_ecb_inplace(buf, key)
+        assert isinstance(pt, memoryview) and pt == data, "розшифрування на місці не повертає дані"
+
+    c = SM4(key)
+    buf = bytearray(32)
+    c.encrypt_inplace(buf)
+    assert c.decrypt_into(buf, memoryview(buf)) == 32 and buf == bytes(32)
+
+
+# ---------- 8. Потокова обробка ----------
+
+def test_streaming_encryptor_decryptor():
+    key = generate_key()
+    for n in (0, 1, 15, 16, 17, 100, 1000):
+        data = bytes(range(256)) * 4
+        data = data[:n]
+        expected = sm4_encrypt_ecb(data, key)
+        for step in (1, 16, 33):
+            enc = sm4_core.SM4Encryptor(key)
+            ct = b"".join(enc.update(data[i:i + step]) for i in range(0, n, step)) + enc.finalize()
+            assert ct == expected, "SM4Encryptor не збігається з sm4_encrypt_ecb"
+
+            dec = sm4_core.SM4Decryptor(key)
+            pt = b"".join(dec.update(ct[i:i + step]) for i in range(0, len(ct), step)) + dec.finalize()
+            assert pt == data, "SM4Decryptor не повертає вихідні дані"
+
+    dec = sm4_core.SM4Decryptor(key)
+    dec.update(expected[:-5])
+    try:
+        dec.finalize()
+    except ValueError:
+        return
+    assert False, "Обрізаний потік має викликати помилку"
+
+
+# ---------- 9. Режим CTR ----------
+
+CTR_PLAINTEXT = (
+    "AAAAAAAAAAAAAAAABBBBBBBBBBBBBBBB CCCCCCCCCCCCCCCCDDDDDDDDDDDDDDDD"
+    "EEEEEEEEEEEEEEEEFFFFFFFFFFFFFFFF AAAAAAAAAAAAAAAABBBBBBBBBBBBBBBB"
+)
+
+
+def test_ctr_vectors():
+    """
+    SM4-CTR, draft-ribose-cfrg-sm4 (A.2.5.1, A.2.5.2):
+    IV = 000102030405060708090A0B0C0D0E0F
+    """
+    iv = hex_to_bytes("000102030405060708090A0B0C0D0E0F")
+    pt = hex_to_bytes(CTR_PLAINTEXT)
+    vectors = [
+        ("0123456789ABCDEFFEDCBA9876543210",
+         "AC3236CB970CC20791364C395A1342D1 A3CBC1878C6F30CD074CCE385CDD70C7"
+         "F234BC0E24C11980FD1286310CE37B92 6E02FCD0FAA0BAF38B2933851D824514"),
+        ("FEDCBA98765432100123456789ABCDEF",
+         "5DCCCD25B95AB07417A08512EE160E2F 8F661521CBBAB44CC87138445BC29E5C"
+         "0AE0297205D62704173B21239B887F6C 8CB5B800917A2488284BDE9E16EA2906"),
+    ]
+    for key_hex, ct_hex in vectors:
+        key = hex_to_bytes(key_hex)
+        ct = sm4_core.sm4_ctr_encrypt(pt, key, iv)
+        assert ct == hex_to_bytes(ct_hex), "CTR: шифрування не співпало з еталоном"
+        assert sm4_core.sm4_ctr_decrypt(ct, key, iv) == pt, "CTR: розшифрування не повертає вихідні дані"
+
+
+def test_ctr_seek():
+    key, nonce = generate_key(), b"\xff" * 15 + b"\xfe"  # лічильник переходить через 2^128
+    data = bytes(range(256)) * 3
+    ct = sm4_core.sm4_ctr_encrypt(data, key, nonce)
+
+    ctr = sm4_core.SM4CTR(key, nonce)
+    ctr.seek(301)
+    assert ctr.decrypt(ct[301:517]) == data[301:517], "CTR: seek() дає неправильний діапазон"
+    assert ctr.tell() == 517
+
+    ctr = sm4_core.SM4CTR(key, nonce)
+    parts = [ctr.update(data[i:i + 7]) for i in range(0, len(data), 7)]
+    assert b"".join(parts) == ct, "CTR: потокова обробка порціями розійшлася"
+
+
+# ---------- 10. Режим CBC ----------
+
+def test_cbc_vectors():
+    """
+    SM4-CBC, draft-ribose-cfrg-sm4 (A.2.2.1, A.2.2.2), без доповнення:
+    IV = 000102030405060708090A0B0C0D0E0F
+    """
+    iv = hex_to_bytes("000102030405060708090A0B0C0D0E0F")
+    pt = hex_to_bytes("AAAAAAAABBBBBBBBCCCCCCCCDDDDDDDD EEEEEEEEFFFFFFFFAAAAAAAABBBBBBBB")
+    vectors = [
+        ("0123456789ABCDEFFEDCBA9876543210",
+         "78EBB11CC40B0A48312AAEB2040244CB 4CB7016951909226979B0D15DC6A8F6D"),
+        ("FEDCBA98765432100123456789ABCDEF",
+         "0D3A6DDC2D21C698857215587B7BB59A 91F2C147911A4144665E1FA1D40BAE38"),
+    ]
+    for key_hex, ct_hex in vectors:
+        key = hex_to_bytes(key_hex)
+        ct = sm4_core.sm4_encrypt_cbc(pt, key, iv, padding=False)
+        assert ct == hex_to_bytes(ct_hex), "CBC: шифрування не співпало з еталоном"
+        assert sm4_core.sm4_decrypt_cbc(ct, key, iv, padding=False) == pt, "CBC: розшифрування не співпало"
+
+
+def test_cbc_roundtrip():
+    key, iv = generate_key(), generate_key()
+    for n in (0, 1, 16, 17, 5000):
+        data = (bytes(range(256)) * 20)[:n]
+        ct = sm4_core.sm4_encrypt_cbc(data, key, iv)
+        assert len(ct) == sm4_core.pkcs7_padded_length(n)
+        assert sm4_core.sm4_decrypt_cbc(ct, key, iv) == data, "CBC roundtrip failed"
+        assert sm4_core.sm4_decrypt_cbc(ct, key, iv, workers=2, threshold=0) == data, "CBC parallel roundtrip failed"
+
+    try:
+        pt = sm4_core.sm4_decrypt_cbc(ct, generate_key(), iv)
+    except ValueError:
+        return
+    assert pt != data, "CBC: неправильний ключ не повинен давати вихідний текст"
+
+
+# ---------- 11. Режим GCM ----------
+
+def test_gcm_rfc8998():
+    """RFC 8998, Appendix A.1 (SM4-GCM)."""
+    key = hex_to_bytes("0123456789ABCDEFFEDCBA9876543210")
+    iv = hex_to_bytes("00001234567800000000ABCD")
+    aad = hex_to_bytes("FEEDFACEDEADBEEFFEEDFACEDEADBEEFABADDAD2")
+    pt = hex_to_bytes(
+        "AAAAAAAAAAAAAAAABBBBBBBBBBBBBBBB CCCCCCCCCCCCCCCCDDDDDDDDDDDDDDDD"
+        "EEEEEEEEEEEEEEEEFFFFFFFFFFFFFFFF EEEEEEEEEEEEEEEEAAAAAAAAAAAAAAAA"
+    )
+    exp_ct = hex_to_bytes(
+        "17F399F08C67D5EE19D0DC9969C4BB7D 5FD46FD3756489069157B282BB200735"
+        "D82710CA5C22F0CCFA7CBF93D496AC15 A56834CBCF98C397B4024A2691233B8D"
+    )
+    exp_tag = hex_to_bytes("83DE3541E4C2B58177E065A9BF7B62EC")
+
+    out = sm4_core.sm4_gcm_encrypt(pt, key, iv, aad)
+    assert out == exp_ct + exp_tag, "GCM: шифртекст або тег не співпали з RFC 8998"
+    assert sm4_core.sm4_gcm_decrypt(out, key, iv, aad) == pt, "GCM: розшифрування не співпало"
+
+    tampered = bytearray(out)
+    tampered[5] ^= 1
+    try:
+        sm4_core.sm4_gcm_decrypt(bytes(tampered), key, iv, aad)
+    except ValueError:
+        return
+    assert False, "GCM: змінений шифртекст має викликати помилку автентичності"
+
+
+def test_gcm_streaming_and_ghash_tables():
+    def gf_mul(x, y):
+        z, v = 0, y
+        for i in range(127, -1, -1):
+            if (x >> i) & 1:
+                z ^= v
+            v = (v >> 1) ^ (0xE1 << 120) if v & 1 else v >> 1
+        return z
+
+    h = int.from_bytes(generate_key(), "big")
+    tables = sm4_core._ghash_tables(h)
+    for _ in range(10):
+        x = generate_key()
+        y = 0
+        for j, b in enumerate(x):
+            y ^= tables[j][b]
+        assert y == gf_mul(int.from_bytes(x, "big"), h), "GHASH: табличне множення розійшлося"
+
+    key, iv, aad = generate_key(), b"nonce-of-any-length", b"header"
+    data = bytes(range(256)) * 3
+    enc = sm4_core.SM4GCMEncryptor(key, iv, aad)
+    ct = b"".join(enc.update(data[i:i + 37]) for i in range(0, len(data), 37))
+    tag = enc.finalize()
+    assert ct + tag == sm4_core.sm4_gcm_encrypt(data, key, iv, aad), "GCM: потокове шифрування розійшлося"
+
+    dec = sm4_core.SM4GCMDecryptor(key, iv, aad)
+    pt = b"".join(dec.update(ct[i:i + 50]) for i in range(0, len(ct), 50))
+    dec.finalize(tag)
+    assert pt == data, "GCM: потокове розшифрування не повертає дані"
+
+
+# ---------- 12. Режим XTS ----------
+
+def test_xts_matches_direct_construction():
+    """SM4-XTS порівнюється з прямою поблоковою побудовою IEEE 1619: C = E1(P ^ T) ^ T."""
+    key = generate_key() + generate_key()
+    xts = sm4_core.SM4XTS(key, sector_size=64)
+    k1, k2 = SM4(key[:16]), SM4(key[16:])
+    data = bytes(range(256))
+
+    expected = b""
+    for s in range(4):
+        t = int.from_bytes(k2.encrypt_block((10 + s).to_bytes(16, "little")), "little")
+        for j in range(4):
+            tb = t.to_bytes(16, "little")
+            p = data[64 * s + 16 * j:64 * s + 16 * j + 16]
+            c = k1.encrypt_block(bytes(a ^ b for a, b in zip(p, tb)))
+            expected += bytes(a ^ b for a, b in zip(c, tb))
+            t = ((t << 1) ^ (0x87 if t >> 127 else 0)) & ((1 << 128) - 1)
+
+    assert bytes(xts.encrypt_sectors(data, 10)) == expected, "XTS: пакетне шифрування розійшлося"
+    assert xts.encrypt_sector(data[64:128], 11) == expected[64:128], "XTS: шифрування сектора розійшлося"
+
+    buf = bytearray(expected)
+    xts.decrypt_sectors(buf, 10, dst=buf)
+    assert buf == data, "XTS: розшифрування на місці не повертає дані"
+
+    for n in (17, 40, 63):  # викрадення шифртексту
+        ct = xts.encrypt_sector(data[:n], 5)
+        assert len(ct) == n and xts.decrypt_sector(ct, 5) == data[:n], "XTS: CTS roundtrip failed"
+
+
+# ---------- 13. Режими OFB / CFB та пул гамми ----------
+
+def test_ofb_cfb_vectors():
+    """
+    draft-ribose-cfrg-sm4, A.2.3.1 (CFB) та A.2.4.1 (OFB):
+    key = 0123456789ABCDEFFEDCBA9876543210, IV = 000102030405060708090A0B0C0D0E0F
+    """
+    key = hex_to_bytes("0123456789ABCDEFFEDCBA9876543210")
+    iv = hex_to_bytes("000102030405060708090A0B0C0D0E0F")
+    pt = hex_to_bytes("AAAAAAAABBBBBBBBCCCCCCCCDDDDDDDD EEEEEEEEFFFFFFFFAAAAAAAABBBBBBBB")
+    cfb = hex_to_bytes("AC3236CB861DD316E6413B4E3C7524B7 69D4C54ED433B9A0346009BEB37B2B3F")
+    ofb = hex_to_bytes("AC3236CB861DD316E6413B4E3C7524B7 1D01ACA2487CA582CBF5463E6698539B")
+
+    assert sm4_core.sm4_encrypt_cfb(pt, key, iv) == cfb, "CFB: шифрування не співпало з еталоном"
+    assert sm4_core.sm4_decrypt_cfb(cfb, key, iv) == pt, "CFB: розшифрування не співпало"
+    assert sm4_core.sm4_encrypt_ofb(pt, key, iv) == ofb, "OFB: шифрування не співпало з еталоном"
+    assert sm4_core.sm4_decrypt_ofb(ofb[20:], key, iv, offset=20) == pt[20:], "OFB: offset не працює"
+
+
+def test_keystream_pool():
+    key, iv = generate_key(), generate_key()
+    msg = b"short latency-sensitive message"
+    with sm4_core.ofb_keystream_pool(key, iv, size=1024, refill_chunk=256, background=False) as pool:
+        assert pool.refill() == 1024
+        results = [pool.xor(msg) for _ in range(40)]  # 40 * 31 > 1024: будуть і промахи
+        ofb = sm4_core.SM4OFB(key, iv)  # послідовне розшифрування зі збереженням стану гамми
+        for offset, ct in results:
+            ofb.seek(offset)
+            assert ofb.decrypt(ct) == msg, "OFB-пул: гамма розійшлася"
+        assert ofb.tell() == 40 * len(msg)
+        offset, ct = results[3]
+        ofb.seek(offset)  # назад — повторна генерація від IV
+        assert ofb.decrypt(ct) == sm4_core.sm4_decrypt_ofb(ct, key, iv, offset=offset) == msg
+        st = pool.stats()
+        assert st["hits"] > 0 and st["misses"] > 0 and st["bytes_served"] == 40 * len(msg), st
+
+    with sm4_core.ctr_keystream_pool(key, iv, size=4096) as pool:
+        offset, ct = pool.xor(msg * 3)
+        assert sm4_core.sm4_ctr_decrypt(ct, key, iv, offset=offset) == msg * 3, "CTR-пул: гамма розійшлася"
+
+
+# ---------- 14. Шифрування файлів через mmap ----------
+
+def test_encrypt_file_mmap(tmp_dir: Path):
+    key = generate_key()
+    src, enc, dec = tmp_dir / "mm_src.bin", tmp_dir / "mm_src.bin.txt", tmp_dir / "mm_dec.bin"
+    for n in (0, 15, 16, 5000):
+        data = (bytes(range(256)) * 20)[:n]
+        src.write_bytes(data)
+        for use_mmap in (True, False):
+            sm4_core.encrypt_file(src, enc, key, use_mmap=use_mmap, window=1024)
+            assert enc.read_bytes() == sm4_encrypt_ecb(data, key), "encrypt_file: формат не сумісний з ECB"
+            sm4_core.decrypt_file(enc, dec, key, use_mmap=use_mmap, window=1024)
+            assert dec.read_bytes() == data, "decrypt_file: roundtrip failed"
+
+    dec.unlink()
+    try:
+        sm4_core.decrypt_file(enc, dec, generate_key())
+    except ValueError:
+        assert not dec.exists(), "після помилки не повинен лишатися частковий файл"
+
+    # posix_fallocate: «не підтримується» — розріджений файл і mmap; ENOSPC — потокова обробка
+    if hasattr(os, "posix_fallocate"):
+        old_fallocate = os.posix_fallocate
+        for err, mapped in ((errno.EOPNOTSUPP, True), (errno.ENOSPC, False)):
+            def failing_fallocate(fd, offset, length, err=err):
+                raise OSError(err, os.strerror(err))
+
+            os.posix_fallocate = failing_fallocate
+            try:
+                written = sm4_core._crypt_file_mmap(src, enc, key, False, None, 1024)
+                assert (written is not None) == mapped, f"errno {err}: mmap={written is not None}"
+                if not mapped:
+                    assert not enc.exists(), "частковий файл має видалятися перед потоковою обробкою"
+                sm4_core.encrypt_file(src, enc, key)
+                assert enc.read_bytes() == sm4_encrypt_ecb(data, key), "відкат на потокову обробку: формат"
+            finally:
+                os.posix_fallocate = old_fallocate
+
+    try:
+        sm4_core.encrypt_file(src, enc, key, window=8)
+    except ValueError:
+        pass
+    else:
+        assert False, "Вікно, менше за блок, має викликати помилку"
+    try:
+        sm4_core.encrypt_file(src, src, key)
+    except ValueError:
+        return
+    assert False, "Однакові вхідний і вихідний файли мають викликати помилку"
+
+
+# ---------- 15. Паралельна обробка ----------
+
+def test_parallel_matches_serial():
+    key, nonce = generate_key(), generate_key()
+    data = bytes(range(256)) * 1030 + b"tail"
+    old_chunk = sm4_core._PARALLEL_MIN_CHUNK
+    sm4_core._PARALLEL_MIN_CHUNK = 16 * 1024  # кілька порцій навіть для невеликих даних
+    try:
+        ct = sm4_core.sm4_encrypt_ecb_parallel(data, key, workers=2, threshold=0)
+        assert ct == sm4_encrypt_ecb(data, key), "паралельний ECB розійшовся з послідовним"
+        assert sm4_core.sm4_decrypt_ecb_parallel(ct, key, workers=2, threshold=0) == data
+
+        # неправильний ключ — ValueError (а не BufferError зі спільної пам'яті): і за перевіркою
+        # останнього блоку до запуску пулу, і за зняттям доповнення після нього
+        old_tail = sm4_core._check_ecb_tail
+        for tail_check in (old_tail, lambda cipher, block: 0):
+            sm4_core._check_ecb_tail = tail_check
+            try:
+                sm4_core.sm4_decrypt_ecb_parallel(ct, generate_key(), workers=2, threshold=0)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("паралельне розшифрування має відкидати неправильний ключ")
+            finally:
+                sm4_core._check_ecb_tail = old_tail
+
+        ctr = sm4_core.sm4_ctr_encrypt_parallel(data, key, nonce, offset=48, workers=2, threshold=0)
+        assert ctr == sm4_core.sm4_ctr_encrypt(data, key, nonce, offset=48), "паралельний CTR розійшовся"
+    finally:
+        sm4_core._PARALLEL_MIN_CHUNK = old_chunk
+
+
+# ---------- 16. Реєстр рушіїв ----------
+
+def test_backend_registry(tmp_dir: Path):
+    key = generate_key()
+    data = "Реєстр рушіїв SM4 ".encode("utf-8") * 30
+    expected = sm4_encrypt_ecb(data, key, backend="reference")
+    for b in sm4_core.available_backends():
+        ct = sm4_encrypt_ecb(data, key, backend=b.name)
+        assert ct == expected, f"рушій {b.name}: шифртекст розійшовся з еталоном"
+        assert sm4_decrypt_ecb(ct, key, backend=b.name) == data, f"рушій {b.name}: roundtrip failed"
+
+    try:
+        sm4_encrypt_ecb(data, key, backend="no-such-backend")
+    except ValueError:
+        pass
+    else:
+        assert False, "Невідомий рушій має викликати помилку"
+
+    cache = tmp_dir / "backends.json"
+    old_env = os.environ.get("SM4_BACKEND_CACHE")
+    os.environ["SM4_BACKEND_CACHE"] = str(cache)
+    try:
+        choices = sm4_core.calibrate_backends(sizes=(64, 1024))
+        assert cache.exists(), "результат калібрування не збережено у файл"
+        assert sm4_core._load_calibration() == choices, "кеш калібрування не читається"
+        assert sm4_core.select_backend(10 ** 6).name == choices[1024]
+    finally:
+        if old_env is None:
+            del os.environ["SM4_BACKEND_CACHE"]
+        else:
+            os.environ["SM4_BACKEND_CACHE"] = old_env
+        sm4_core._calibration = None
+
+
+# ---------- 17. Кеш розгорнутих ключів ----------
+
+def test_key_schedule_cache():
+    cache = sm4_core.KeyScheduleCache(maxsize=2)
+    k1, k2, k3 = generate_key(), generate_key(), generate_key()
+
+    rk1 = cache.get(k1)
+    assert list(rk1) == SM4(k1)._rk_enc, "кеш повертає неправильні раундові ключі"
+    assert cache.get(k1) == rk1, "повторний запит має брати ключі з кешу"
+    stored = cache._data[k1]
+    cache.get(k2)
+    cache.get(k3)  # витісняє k1
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["evictions"], st["size"]) == (1, 3, 1, 2), st
+    assert stored == [0] * 32, "витіснені раундові ключі мають бути затерті"
+    assert list(rk1) == SM4(k1)._rk_enc, "затирання не повинно зачіпати ключі, видані викликачу"
+
+    stored = cache._data[k3]
+    rk3 = cache.get(k3)
+    cache.clear()
+    assert len(cache) == 0 and stored == [0] * 32, "clear() має затерти та видалити ключі"
+    assert list(rk3) == SM4(k3)._rk_enc
+
+    c = SM4(k2, round_keys=SM4(k2)._rk_enc)
+    assert c.encrypt_block(k1) == SM4(k2).encrypt_block(k1), "SM4(round_keys=...) розійшовся з SM4"
+
+
+def test_key_schedule_cache_concurrent_eviction():
+    keys = [bytes([i]) * 16 for i in range(12)]
+    block = bytes(range(16)) * 4
+    reference = {k: sm4_encrypt_ecb(block, k, backend="table") for k in keys}
+    cache = sm4_core.KeyScheduleCache(maxsize=2)  # постійне витіснення
+    failures = []
+
+    def worker(offset: int) -> None:
+        for i in range(300):
+            k = keys[(i + offset) % len(keys)]
+            c = sm4_core.get_backend("table").new(k, round_keys=cache.get(k))
+            if bytes(c.encrypt_blocks(sm4_core.pkcs7_pad(block, 16))) != reference[k]:
+                failures.append(k)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not failures, f"витіснення в іншому потоці зіпсувало {len(failures)} шифртекстів"
+
+
+def test_expand_keys():
+    keys = [generate_key() for _ in range(70)]
+    for use_numpy in (False, True):
+        if use_numpy and not sm4_core.HAVE_NUMPY:
+            continue
+        ek = sm4_core.expand_keys(b"".join(keys), use_numpy=use_numpy)
+        assert len(ek) == len(keys)
+        for i in (0, 33, 69):
+            assert ek[i] == SM4(keys[i])._rk_enc, "expand_keys: раундові ключі не співпали"
+            block = keys[i - 1]
+            assert ek.cipher(i).encrypt_block(block) == SM4(keys[i]).encrypt_block(block)
+
+    assert len(sm4_core.expand_keys(keys[:3])) == 3, "expand_keys має приймати список ключів"
+    try:
+        sm4_core.expand_keys(b"\x00" * 17)
+    except ValueError:
+        return
+    assert False, "Буфер некратної довжини має викликати помилку"
+
+
+# ---------- 18. Контейнер з індексом порцій ----------
+
+def test_container_format(tmp_dir: Path):
+    key = generate_key()
+    src, enc, dec = tmp_dir / "ct_src.bin", tmp_dir / "ct_src.sm4c", tmp_dir / "ct_dec.bin"
+    data = bytes(range(256)) * 17 + b"tail"
+    src.write_bytes(data)
+    for mode in ("gcm", "ctr"):
+        for workers in (1, 2):
+            sm4_core.encrypt_container(src, enc, key, mode=mode, chunk_size=1000, workers=workers)
+            assert sm4_core.is_container(enc), "контейнер не розпізнано"
+            sm4_core.decrypt_container(enc, dec, key, workers=workers)
+            assert dec.read_bytes() == data, f"контейнер {mode}: roundtrip failed"
+        with sm4_core.ContainerReader(enc, key) as reader:
+            assert reader.size == len(data) and len(reader.index) == 5
+            for offset, length in ((0, 10), (999, 2), (1500, 3000), (4300, 100)):
+                assert reader.read_range(offset, length) == data[offset:offset + length], "read_range"
+
+    src.write_bytes(b"")
+    sm4_core.encrypt_container(src, enc, key)
+    sm4_core.decrypt_container(enc, dec, key)
+    assert dec.read_bytes() == b"", "порожній контейнер"
+
+    sm4_core.encrypt_file(src, dec, key)
+    assert not sm4_core.is_container(dec), "старий формат ECB не є контейнером"
+
+    src.write_bytes(data)
+    sm4_core.encrypt_container(src, enc, key, chunk_size=1000)
+    damaged = bytearray(enc.read_bytes())
+    damaged[1500] ^= 1
+    enc.write_bytes(damaged)
+    dec.unlink()
+    try:
+        sm4_core.decrypt_container(enc, dec, key)
+    except ValueError:
+        assert not dec.exists(), "після помилки не повинен лишатися частковий файл"
+    else:
+        assert False, "Пошкоджена порція GCM має викликати помилку"
+    try:
+        sm4_core.ContainerReader(enc, generate_key())
+    except ValueError:
+        return
+    assert False, "Неправильний ключ має виявлятися за KCV"
+
+
+# ---------- 19. Швидка перевірка ключа ----------
+
+def test_check_key(tmp_dir: Path):
+    key, wrong = bytes(16), bytes(range(16))
+    src, legacy, cont = tmp_dir / "ck_src.bin", tmp_dir / "ck_src.bin.txt", tmp_dir / "ck_src.sm4c"
+    src.write_bytes(b"check key " * 100)
+    sm4_core.encrypt_file(src, legacy, key)
+    sm4_core.encrypt_container(src, cont, key)
+    assert sm4_core.check_key(legacy, key) == "ecb"
+    assert sm4_core.check_key(cont, key) == "container"
+
+    # для цього ключа останній блок з чужим ключем дає некоректне доповнення
+    for path in (legacy, cont):
+        try:
+            sm4_core.check_key(path, wrong)
+        except ValueError:
+            continue
+        assert False, f"{path.name}: неправильний ключ має відкидатися без повного розшифрування"
+    try:
+        sm4_decrypt_ecb(legacy.read_bytes(), wrong)
+    except ValueError:
+        return
+    assert False, "sm4_decrypt_ecb має відкидати неправильний ключ"
+
+
+# ---------- 20. SM4-CMAC ----------
+
+def _cmac_reference(data: bytes, key: bytes) -> bytes:
+    """Пряма реалізація NIST SP 800-38B поверх SM4.encrypt_block."""
+    cipher = SM4(key)
+
+    def dbl(x: int) -> int:
+        x <<= 1
+        return (x ^ 0x87) & ((1 << 128) - 1) if x >> 128 else x
+
+    k1 = dbl(int.from_bytes(cipher.encrypt_block(bytes(16)), "big"))
+    k2 = dbl(k1)
+    blocks = [data[i:i + 16] for i in range(0, len(data), 16)] or [b""]
+    if len(blocks[-1]) == 16:
+        last = int.from_bytes(blocks[-1], "big") ^ k1
+    else:
+        last = int.from_bytes(blocks[-1] + b"\x80" + bytes(15 - len(blocks[-1])), "big") ^ k2
+    state = 0
+    for block in blocks[:-1]:
+        state = int.from_bytes(cipher.encrypt_block((int.from_bytes(block, "big") ^ state).to_bytes(16, "big")), "big")
+    return cipher.encrypt_block((state ^ last).to_bytes(16, "big"))
+
+
+def test_cmac(tmp_dir: Path):
+    key = generate_key()
+    data = bytes(range(256)) * 20 + b"cmac"
+    for n in (0, 1, 15, 16, 17, 32, 100, len(data)):
+        assert sm4_core.sm4_cmac(data[:n], key) == _cmac_reference(data[:n], key), f"CMAC: {n} байтів"
+
+    mac = sm4_core.SM4CMAC(key)
+    for cut in (0, 5, 16, 33, 48, 1000, len(data)):
+        mac.reset()
+        mac.update(data[:cut])
+        mac.update(data[cut:])
+        assert mac.digest() == _cmac_reference(data, key), f"CMAC: розбиття на {cut}"
+
+    path = tmp_dir / "cmac.bin"
+    path.write_bytes(data)
+    tag = sm4_core.cmac_file(path, key, chunk_size=1000)
+    assert tag == _cmac_reference(data, key), "cmac_file розійшовся з еталоном"
+    assert sm4_core.verify_file(path, key, tag, chunk_size=64)
+    assert sm4_core.verify_file(path, key, tag[:8], mac=mac), "укорочений тег"
+    path.write_bytes(data[:-1] + b"X")
+    assert not sm4_core.verify_file(path, key, tag), "змінений файл має не пройти перевірку"
+
+
+# ---------- 21. Стиснення перед шифруванням ----------
+
+def test_container_compression(tmp_dir: Path):
+    key = generate_key()
+    src, enc, dec = tmp_dir / "cz_src.csv", tmp_dir / "cz_src.sm4c", tmp_dir / "cz_dec.csv"
+    data = "".join(f"{i},sensor-{i % 7},{i * 0.5:.1f}\n" for i in range(3000)).encode()
+    src.write_bytes(data)
+    plain_size = sm4_core.encrypt_container(src, enc, key, chunk_size=8192)
+    for name in sm4_core.CONTAINER_COMPRESSORS:
+        for workers in (1, 2):
+            size = sm4_core.encrypt_container(src, enc, key, chunk_size=8192, workers=workers, compression=name)
+            assert size < plain_size // 2, f"{name}: дані не стиснуто"
+            sm4_core.decrypt_container(enc, dec, key)
+            assert dec.read_bytes() == data, f"{name}: roundtrip failed"
+        with sm4_core.ContainerReader(enc, key) as reader:
+            assert reader.read_range(20000, 50) == data[20000:20050], f"{name}: read_range"
+
+    # вже стиснуті дані: стиснення вимикається за зразком
+    noise = os.urandom(40000)
+    src.write_bytes(noise)
+    with open(enc, "wb") as f:
+        writer = sm4_core.ContainerWriter(f, key, chunk_size=8192, compression="zlib")
+        writer.write(noise)
+        writer.close()
+    assert writer.compression is None, "нестисливі дані не повинні стискатися"
+    sm4_core.decrypt_container(enc, dec, key)
+    assert dec.read_bytes() == noise
+
+    # «бомба» стиснення: порція, що розпаковується понад chunk_size із заголовка, відкидається
+    for name in sm4_core.CONTAINER_COMPRESSORS:
+        cid = sm4_core._COMPRESSORS[name][0]
+        header = sm4_core._new_container_header(SM4(key), "ctr", 1024, cid)
+        crypto = sm4_core._ContainerCrypto(key, header)
+        assert crypto.open(0, crypto.seal(0, bytes(1024), True), True) == bytes(1024), name
+        for sealed in (crypto.seal(0, bytes(1 << 20), True), crypto.seal(0, bytes(1024), True)[:-4]):
+            try:
+                crypto.open(0, sealed, True)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"{name}: завелика або обрізана порція має відкидатися")
+
+    try:
+        sm4_core.encrypt_container(src, enc, key, compression="rar")
+    except ValueError:
+        return
+    assert False, "Невідомий алгоритм стиснення має викликати помилку"
+
+
+# ---------- 22. Конвеєр читання / шифрування / запису ----------
+
+def test_file_pipeline(tmp_dir: Path):
+    key = generate_key()
+    src, enc, dec = tmp_dir / "pl_src.bin", tmp_dir / "pl_src.bin.txt", tmp_dir / "pl_dec.bin"
+    for n in (0, 15, 1024, 1040, 5000):
+        data = (bytes(range(256)) * 20)[:n]
+        src.write_bytes(data)
+        stats = sm4_core.pipeline_encrypt_file(src, enc, key, buffer_size=1024, buffers=3)
+        assert enc.read_bytes() == sm4_encrypt_ecb(data, key), "конвеєр: формат не сумісний з ECB"
+        assert stats["bytes_read"] == n and stats["bytes_written"] == enc.stat().st_size, stats
+        sm4_core.pipeline_decrypt_file(enc, dec, key, buffer_size=1024)
+        assert dec.read_bytes() == data, "конвеєр: roundtrip failed"
+
+    assert set(stats["busy"]) == set(stats["idle"]) == {"reader", "crypt", "writer"}
+    assert stats["bottleneck"] in stats["busy"]
+
+    # повторний run() того ж конвеєра: статистика лише за останній файл
+    data = bytes(range(256)) * 8
+    src.write_bytes(data)
+    with sm4_core.FilePipeline(key, buffer_size=1024, buffers=3) as pipeline:
+        for _ in range(2):
+            stats = pipeline.run(src, enc)
+            assert stats["bytes_read"] == len(data) and stats["bytes_written"] == len(data) + 16, stats
+    assert enc.read_bytes() == sm4_encrypt_ecb(data, key), "конвеєр: повторний run() зіпсував результат"
+
+    enc.write_bytes(enc.read_bytes()[:-3])
+    dec.unlink()
+    try:
+        sm4_core.pipeline_decrypt_file(enc, dec, key, buffer_size=1024)
+    except ValueError:
+        assert not dec.exists(), "після помилки не повинен лишатися частковий файл"
+        return
+    assert False, "Обрізаний шифртекст має викликати помилку"
+
+
+# ---------- 23. Asyncio API ----------
+
+def test_async_api(tmp_dir: Path):
+    key = generate_key()
+    src, enc, dec = tmp_dir / "as_src.bin", tmp_dir / "as_src.bin.txt", tmp_dir / "as_dec.bin"
+    old_chunk, old_limit = sm4_core.ASYNC_CHUNK_SIZE, sm4_core.ASYNC_MAX_CONCURRENCY
+
+    async def main():
+        for n in (0, 15, 1000, 1008, 3000):
+            data = (bytes(range(256)) * 12)[:n]
+            ct = await sm4_core.aencrypt(data, key)
+            assert ct == sm4_encrypt_ecb(data, key), f"aencrypt: {n} байтів"
+            assert await sm4_core.adecrypt(ct, key) == data, "adecrypt: roundtrip failed"
+            src.write_bytes(data)
+            await sm4_core.aencrypt_file(src, enc, key)
+            assert enc.read_bytes() == ct, "aencrypt_file: формат не сумісний з ECB"
+            await sm4_core.adecrypt_file(enc, dec, key)
+            assert dec.read_bytes() == data, "adecrypt_file: roundtrip failed"
+
+        messages = [bytes([i]) * (100 * i) for i in range(8)]
+        results = await asyncio.gather(*(sm4_core.aencrypt(m, key) for m in messages))
+        assert results == [sm4_encrypt_ecb(m, key) for m in messages], "паралельні задачі розійшлися"
+
+        # розгортання ключа (і можливе калібрування рушіїв) — лише у виконавці
+        loop_thread, new_cipher = threading.get_ident(), sm4_core.new_cipher
+        on_loop = []
+
+        def tracking_new_cipher(*args, **kwargs):
+            on_loop.append(threading.get_ident() == loop_thread)
+            return new_cipher(*args, **kwargs)
+
+        sm4_core.new_cipher = tracking_new_cipher
+        try:
+            assert await sm4_core.adecrypt(results[-1], key) == messages[-1]
+        finally:
+            sm4_core.new_cipher = new_cipher
+        assert on_loop and not any(on_loop), "adecrypt не повинен створювати шифр у циклі подій"
+
+        # перевірка шляхів (stat/samefile) — теж поза циклом подій
+        on_loop.clear()
+        check_paths = sm4_core._check_distinct_paths
+
+        def tracking_check_paths(*args):
+            on_loop.append(threading.get_ident() == loop_thread)
+            return check_paths(*args)
+
+        sm4_core._check_distinct_paths = tracking_check_paths
+        try:
+            await sm4_core.aencrypt_file(src, enc, key)
+            await sm4_core.adecrypt_file(enc, dec, key)
+            try:
+                await sm4_core.aencrypt_file(src, src, key)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("однакові вхідний і вихідний файли мають викликати помилку")
+        finally:
+            sm4_core._check_distinct_paths = check_paths
+        assert len(on_loop) == 3 and not any(on_loop), "перевірка шляхів не повинна блокувати цикл подій"
+
+        try:
+            await sm4_core.adecrypt(results[-1], generate_key())
+        except ValueError:
+            return
+        assert False, "adecrypt має відкидати неправильний ключ"
+
+    sm4_core.configure_async(chunk_size=1000, max_concurrency=2)
+    try:
+        asyncio.run(main())
+    finally:
+        sm4_core.configure_async(max_concurrency=old_limit, chunk_size=old_chunk)
+
+
+# ---------- 24. Локальний демон та клієнт ----------
+
+def test_daemon(tmp_dir: Path):
+    daemon = SM4Daemon(str(tmp_dir / "sm4d.sock"), batch_window=0.05)
+    server = threading.Thread(target=lambda: asyncio.run(daemon.serve_forever()))
+    server.start()
+    assert daemon.ready.wait(10), "демон не запустився"
+    key = generate_key()
+    barrier = threading.Barrier(4)
+    failures = []
+
+    def client(i: int) -> None:
+        try:
+            with SM4Client(daemon.path) as c:
+                for n in range(5):
+                    data = bytes([i]) * (i * 10 + n)
+                    barrier.wait()  # запити надходять одночасно й потрапляють в один пакет
+                    ct = c.sm4_encrypt_ecb(data, key)
+                    assert ct == sm4_encrypt_ecb(data, key), "демон: шифртекст розійшовся з sm4_core"
+                    assert c.sm4_decrypt_ecb(ct, key) == data, "демон: roundtrip failed"
+        except Exception as e:
+            failures.append(e)
+            barrier.abort()
+
+    try:
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(4)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert not failures, failures
+
+        with SM4Client(daemon.path) as c:
+            try:
+                c.sm4_decrypt_ecb(b"\x00" * 17, key)
+            except ValueError:
+                pass
+            else:
+                assert False, "некоректна довжина шифртексту має повертати помилку"
+            st = c.stats()
+        assert st["requests"] == 41 and st["errors"] == 1, st
+        assert st["batches"] < st["requests"], "одночасні запити мають об'єднуватися в пакети"
+        assert sum(st["latency_ms_hist"].values()) == st["requests"], st
+    finally:
+        daemon.stop()
+        server.join()
+    assert not os.path.exists(daemon.path), "сокет має видалятися після зупинки"
+
+    # типовий сокет без XDG_RUNTIME_DIR — в окремому каталозі користувача з правами 0700
+    saved_env = {k: os.environ.pop(k, None) for k in ("SM4_DAEMON_SOCKET", "XDG_RUNTIME_DIR")}
+    old_tempdir, tempfile.tempdir = tempfile.tempdir, str(tmp_dir)
+    try:
+        daemon = SM4Daemon()
+        assert os.path.dirname(daemon.path) == str(tmp_dir / f"sm4d-{os.getuid()}"), daemon.path
+        server = threading.Thread(target=lambda: asyncio.run(daemon.serve_forever()))
+        server.start()
+        try:
+            assert daemon.ready.wait(10), "демон не запустився"
+            assert os.stat(os.path.dirname(daemon.path)).st_mode & 0o777 == 0o700
+            with SM4Client() as c:
+                assert c.sm4_decrypt_ecb(c.sm4_encrypt_ecb(b"private", key), key) == b"private"
+        finally:
+            daemon.stop()
+            server.join()
+    finally:
+        tempfile.tempdir = old_tempdir
+        for k, v in saved_env.items():
+            if v is not None:
+                os.environ[k] = v
+
+    # клієнт не надсилає ключ сокету іншого користувача
+    if os.getuid() == 0:
+        foreign_path = str(tmp_dir / "foreign.sock")
+        foreign = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        foreign.bind(foreign_path)
+        foreign.listen(1)
+        os.chown(foreign_path, 12345, -1)
+        try:
+            SM4Client(foreign_path)
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError("клієнт має відмовлятися від чужого сокета")
+        finally:
+            foreign.close()
+            os.unlink(foreign_path)
+
+    # звичайний файл на місці сокета не є «залишком» — демон не стартує й не видаляє його
+    occupied = tmp_dir / "not_a_socket"
+    occupied.write_bytes(b"data")
+    try:
+        asyncio.run(SM4Daemon(str(occupied)).serve_forever())
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("демон має відмовлятися займати шлях звичайного файлу")
+    assert occupied.read_bytes() == b"data", "чужий файл не має видалятися"
+
+
+# ---------- 25. Пакетна обробка дерева каталогів ----------
+
+def test_cli_tree(tmp_dir: Path):
+    key = generate_key()
+    src, out, dec = tmp_dir / "tree_src", tmp_dir / "tree_out", tmp_dir / "tree_dec"
+    (src / "logs" / "old").mkdir(parents=True, exist_ok=True)
+    files = {
+        Path("a.csv"): b"id,value\n" * 50,
+        Path("empty.txt"): b"",
+        Path("logs") / "big.log": bytes(range(256)) * 300 + b"tail",
+        Path("logs") / "old" / "x.bin": bytes(range(100)),
+    }
+    for rel, data in files.items():
+        (src / rel).write_bytes(data)
+
+    for workers in (1, 2):
+        report = sm4_cli.process_tree(src, out, key, workers=workers, force=True,
+                                      large_file_size=20000, chunk_size=4096, pack_files=2)
+        assert report.files == len(files) and not report.errors, report.as_dict()
+        for rel, data in files.items():
+            enc = out / rel.with_name(rel.name + ".txt")
+            assert enc.read_bytes() == sm4_encrypt_ecb(data, key), f"{rel}: формат не сумісний з GUI"
+
+        report = sm4_cli.process_tree(out, dec, key, decrypt=True, workers=workers, force=True,
+                                      large_file_size=20000, chunk_size=4096)
+        assert report.files == len(files) and not report.errors, report.as_dict()
+        for rel, data in files.items():
+            assert (dec / rel).read_bytes() == data, f"{rel}: roundtrip failed"
+
+    report = sm4_cli.process_tree(src, out, key, workers=1)
+    assert report.files == 0 and report.skipped == len(files), "актуальні файли мають пропускатися"
+    stats = report.as_dict()
+    assert set(stats["by_size"]) == {label for _, label in sm4_cli.SIZE_CLASSES}
+
+    # порожній файл і large_file_size=0: файл має оброблятися пакетом, без часткового файлу
+    report = sm4_cli.process_tree(src, tmp_dir / "tree_zero", key, workers=1, large_file_size=0)
+    assert report.files == len(files) and not report.errors, report.as_dict()
+    assert (tmp_dir / "tree_zero" / "empty.txt.txt").read_bytes() == sm4_encrypt_ecb(b"", key)
+    assert not list((tmp_dir / "tree_zero").rglob("*" + sm4_cli.PART_SUFFIX)), "часткові файли не мають лишатися"
+    # помилка одного файлу (висячий симлінк) не зупиняє обробку дерева
+    linked = tmp_dir / "tree_link"
+    linked.mkdir(exist_ok=True)
+    (linked / "ok.txt").write_bytes(b"ok")
+    if not (linked / "dangling").is_symlink():
+        os.symlink(linked / "missing", linked / "dangling")
+    report = sm4_cli.process_tree(linked, tmp_dir / "tree_link_out", key, workers=1, force=True)
+    assert report.files == 1 and len(report.errors) == 1, report.as_dict()
+    assert (tmp_dir / "tree_link_out" / "ok.txt.txt").read_bytes() == sm4_encrypt_ecb(b"ok", key)
+
+    for bad_args in (["encrypt-tree", str(src), str(out), "-k", "k.hex", "--large-mb", "0"],
+                     ["encrypt-tree", str(src), str(out), "-k", "k.hex", "--chunk-mb", "-1"],
+                     ["enc", "-k", "k.hex", "-b", "0"]):
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                sm4_cli.build_parser().parse_args(bad_args)
+        except SystemExit:
+            pass
+        else:
+            raise AssertionError(f"{bad_args}: недодатний розмір має відхилятися")
+
+    report = sm4_cli.process_tree(out, tmp_dir / "tree_bad", generate_key(), decrypt=True,
+                                  workers=1, large_file_size=20000)
+    assert len(report.errors) >= 1, "неправильний ключ має давати помилки"
+    assert not list((tmp_dir / "tree_bad").rglob("*" + sm4_cli.PART_SUFFIX)), "часткові файли мають видалятися"
+
+
+# ---------- 26. Потоковий режим stdin/stdout ----------
+
+def test_cli_pipe(tmp_dir: Path):
+    key = generate_key()
+    key_path = tmp_dir / "pipe_key.hex"
+    sm4_core.save_key_hex(key, str(key_path))
+    data = bytes(range(256)) * 40 + b"pipe"
+    cli = [sys.executable, str(Path(sm4_cli.__file__).resolve())]
+
+    enc = subprocess.run(cli + ["enc", "-k", str(key_path), "-b", "1"], input=data,
+                         capture_output=True, check=True)
+    assert enc.stdout == sm4_encrypt_ecb(data, key), "enc: формат не сумісний з ECB"
+    dec = subprocess.run(cli + ["dec", "-k", str(key_path), "-b", "3"], input=enc.stdout,
+                         capture_output=True, check=True)
+    assert dec.stdout == data, "dec: roundtrip failed"
+
+    bad = subprocess.run(cli + ["dec", "-k", str(key_path)], input=enc.stdout[:-1], capture_output=True)
+    assert bad.returncode != 0 and bad.stderr, "обрізаний шифртекст має завершуватися помилкою"
+
+
 # ---------- Запуск усіх тестів ----------
 
-def run_all():
+def _run_tests(tmp_dir: Path):
     print("Running test_vector_1 ...")
     test_vector_1()
     print("OK")
@@ -161,8 +1148,6 @@ def run_all():
     test_text_roundtrip()
     print("OK")
 
-    tmp_dir = Path("sm4_test_tmp")
-    tmp_dir.mkdir(exist_ok=True)
     print("Running file roundtrip tests ...")
     test_file_roundtrip(tmp_dir)
     print("OK")
@@ -172,8 +1157,116 @@ def run_all():
     test_truncated_ciphertext()
     print("OK")
 
+    print("Running table engine / compiled mode tests ...")
+    test_table_engine_matches_reference()
+    test_compiled_mode()
+    print("OK")
+
+    print("Running batched block API test ...")
+    test_encrypt_blocks_buffers()
+    test_numpy_backend()
+    test_zero_copy_ecb()
+    print("OK")
+
+    print("Running streaming tests ...")
+    test_streaming_encryptor_decryptor()
+    print("OK")
+
+    print("Running CTR tests ...")
+    test_ctr_vectors()
+    test_ctr_seek()
+    print("OK")
+
+    print("Running CBC tests ...")
+    test_cbc_vectors()
+    test_cbc_roundtrip()
+    print("OK")
+
+    print("Running GCM tests ...")
+    test_gcm_rfc8998()
+    test_gcm_streaming_and_ghash_tables()
+    print("OK")
+
+    print("Running XTS test ...")
+    test_xts_matches_direct_construction()
+    print("OK")
+
+    print("Running OFB/CFB and keystream pool tests ...")
+    test_ofb_cfb_vectors()
+    test_keystream_pool()
+    print("OK")
+
+    print("Running mmap file tests ...")
+    test_encrypt_file_mmap(tmp_dir)
+    print("OK")
+
+    print("Running parallel driver test ...")
+    test_parallel_matches_serial()
+    print("OK")
+
+    print("Running backend registry test ...")
+    test_backend_registry(tmp_dir)
+    print("OK")
+
+    print("Running key schedule cache / bulk key expansion tests ...")
+    test_key_schedule_cache()
+    test_key_schedule_cache_concurrent_eviction()
+    test_expand_keys()
+    print("OK")
+
+    print("Running container format test ...")
+    test_container_format(tmp_dir)
+    print("OK")
+
+    print("Running fast key check test ...")
+    test_check_key(tmp_dir)
+    print("OK")
+
+    print("Running SM4-CMAC test ...")
+    test_cmac(tmp_dir)
+    print("OK")
+
+    print("Running container compression test ...")
+    test_container_compression(tmp_dir)
+    print("OK")
+
+    print("Running file pipeline test ...")
+    test_file_pipeline(tmp_dir)
+    print("OK")
+
+    print("Running asyncio API test ...")
+    test_async_api(tmp_dir)
+    print("OK")
+
+    print("Running daemon / client test ...")
+    test_daemon(tmp_dir)
+    print("OK")
+
+    print("Running batch CLI tree test ...")
+    test_cli_tree(tmp_dir)
+    print("OK")
+
+    print("Running stdin/stdout pipe CLI test ...")
+    test_cli_pipe(tmp_dir)
+    print("OK")
+
     print("\n✅ УСІ ТЕСТИ ПРОЙДЕНІ УСПІШНО.")
 
 
+def run_all():
+    tmp_dir = Path("sm4_test_tmp")
+    tmp_dir.mkdir(exist_ok=True)
+    # калібрування рушіїв не повинно писати кеш у домашній каталог того, хто запускає тести
+    old_env = os.environ.get("SM4_BACKEND_CACHE")
+    os.environ["SM4_BACKEND_CACHE"] = str((tmp_dir / "backends.json").resolve())
+    try:
+        _run_tests(tmp_dir)
+    finally:
+        if old_env is None:
+            del os.environ["SM4_BACKEND_CACHE"]
+        else:
+            os.environ["SM4_BACKEND_CACHE"] = old_env
+
+
 if __name__ == "__main__":
     run_all()